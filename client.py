@@ -1,24 +1,36 @@
+import asyncio
 import os
 import gradio as gr
 from langchain_openai import ChatOpenAI
 from mcp_use import MCPAgent, MCPClient
 
+_AGENT: MCPAgent | None = None
+_AGENT_LOCK = asyncio.Lock()
 
-async def web_crawler_demo(query: str):
-    config = {
-        "mcpServers": {
-            "playwright": {
-                "command": "python",
-                "args": ["main.py"],
-                "cwd": os.getenv("MCP_CWD"),
-                "env": {"SERPER_API_KEY": os.getenv("SERPER_API_KEY")},
+
+async def _get_agent() -> MCPAgent:
+    global _AGENT
+    async with _AGENT_LOCK:
+        if _AGENT is None:
+            config = {
+                "mcpServers": {
+                    "playwright": {
+                        "url": os.getenv("MCP_SERVER_URL", "http://localhost:8051/mcp"),
+                    }
+                }
             }
-        }
-    }
-    client = MCPClient(config)
-    llm = ChatOpenAI(model_name="gpt-4o-mini")
-    agent = MCPAgent(client=client, llm=llm, max_steps=20)
-    return await agent.run(query)
+            client = MCPClient(config)
+            llm = ChatOpenAI(model_name="gpt-4o-mini")
+            # Queries share the agent concurrently, so keep each one stateless.
+            agent = MCPAgent(client=client, llm=llm, max_steps=20, memory_enabled=False)
+            await agent.initialize()
+            _AGENT = agent
+    return _AGENT
+
+
+async def web_crawler_demo(query: str):
+    agent = await _get_agent()
+    return await agent.run(query, manage_connector=False)
 
 
 def main():
@@ -27,7 +39,7 @@ def main():
         search_box = gr.Textbox(label="Enter your query")
         output_box = gr.Markdown(label="Results")
         search_box.submit(web_crawler_demo, search_box, output_box)
-    demo.launch()
+    demo.queue(default_concurrency_limit=8).launch()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,9 @@
-from typing import List, Dict, Any
-from urllib.parse import urldefrag
-from xml.etree import ElementTree
+import asyncio
+import logging
+from typing import AsyncIterator, List, Dict, Any, Optional, Set, Tuple
 
+import aiohttp
+import psutil
 from crawl4ai import (
     AsyncWebCrawler,
     CrawlerRunConfig,
@@ -9,101 +11,220 @@ from crawl4ai import (
     MemoryAdaptiveDispatcher,
     AdaptiveCrawler,
 )
-import requests
+from lxml import etree
+from pybloom_live import ScalableBloomFilter
+
+from utils import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Run configs are identical across calls, so build them once instead of per crawl.
+DEFAULT_CONFIG = CrawlerRunConfig()
+BYPASS_CONFIG = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
+STREAM_CONFIG = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=True)
+
+# Crawls back off while system memory use is at or above this percentage.
+MEMORY_THRESHOLD_PERCENT = 70.0
+MEMORY_CHECK_INTERVAL = 1.0
+
+
+_SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+_LOC_TAGS = {_SITEMAP_NS + "loc", "loc"}
+_SITEMAP_TAGS = {_SITEMAP_NS + "sitemap", "sitemap"}
+
+
+class _SitemapLocCollector:
+    """
+    lxml parser target collecting the text of every sitemap ``<loc>`` element.
+
+    Used with ``etree.XMLParser(target=...)`` so a sitemap can be parsed while it
+    is being downloaded, without building a tree for the whole document. Locations
+    found under ``<sitemap>`` entries of a sitemap index are kept apart from page
+    locations so nested sitemaps can be followed.
+    """
+
+    def __init__(self):
+        self.urls: List[str] = []
+        self.sitemap_urls: List[str] = []
+        self._in_sitemap = False
+        self._text: Optional[List[str]] = None
+
+    def start(self, tag, attrib):
+        if tag in _LOC_TAGS:
+            self._text = []
+        elif tag in _SITEMAP_TAGS:
+            self._in_sitemap = True
+
+    def data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def end(self, tag):
+        if tag in _LOC_TAGS and self._text is not None:
+            url = "".join(self._text).strip()
+            if url:
+                (self.sitemap_urls if self._in_sitemap else self.urls).append(url)
+            self._text = None
+        elif tag in _SITEMAP_TAGS:
+            self._in_sitemap = False
+
+    def close(self) -> "_SitemapLocCollector":
+        return self
 
 
 class Crawler(AsyncWebCrawler):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            return await super().__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self._http is not None:
+                await self._http.close()
+                self._http = None
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300)
+            )
+        return self._http
+
     @property
     def adaptive_crawling(self) -> AdaptiveCrawler:
         return AdaptiveCrawler(self)
 
     async def simple_crawl(self, url: str) -> List[Dict[str, Any]]:
-        result = await self.arun(url=url, config=CrawlerRunConfig())
+        result = await self.arun(url=url, config=DEFAULT_CONFIG)
         if result.success and result.markdown:
             return [{"url": url, "markdown": result.markdown}]
         else:
-            print(f"Failed to crawl {url}: {result.error_message}")
+            logger.warning("Failed to crawl %s: %s", url, result.error_message)
             return []
 
     async def crawl_sitemap(
         self, sitemap_url: str, max_concurrent: int = 10
-    ) -> List[Dict[str, Any]]:
-        resp = requests.get(sitemap_url)
-        urls = []
-
-        if resp.status_code == 200:
-            try:
-                tree = ElementTree.fromstring(resp.content)
-                urls = [loc.text for loc in tree.findall(".//{*}loc")]
-            except Exception as e:
-                print(f"Error parsing sitemap XML: {e}")
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # The aiohttp connector is unbounded, so cap concurrent sitemap downloads.
+        fetch_slots = asyncio.Semaphore(max_concurrent)
+        urls = await self._fetch_sitemap_urls(sitemap_url, {sitemap_url}, fetch_slots)
 
         if urls:
-            return await self.crawl_multiple_urls(urls, max_concurrent=max_concurrent)
-        return urls
+            async for doc in self.crawl_multiple_urls(
+                urls, max_concurrent=max_concurrent
+            ):
+                yield doc
+
+    async def _fetch_sitemap_urls(
+        self,
+        sitemap_url: str,
+        seen_sitemaps: Set[str],
+        fetch_slots: asyncio.Semaphore,
+    ) -> List[str]:
+        collector = _SitemapLocCollector()
+
+        async with fetch_slots:
+            try:
+                async with self.http.get(sitemap_url) as resp:
+                    if resp.status != 200:
+                        return []
+                    parser = etree.XMLParser(
+                        target=collector, resolve_entities=False, no_network=True
+                    )
+                    async for chunk in resp.content.iter_chunked(65536):
+                        parser.feed(chunk)
+                    parser.close()
+            except Exception:
+                logger.warning("Failed to fetch sitemap %s", sitemap_url, exc_info=True)
+                return []
+
+        nested_sitemaps = [
+            url for url in collector.sitemap_urls if url not in seen_sitemaps
+        ]
+        seen_sitemaps.update(nested_sitemaps)
+        for urls in await asyncio.gather(
+            *(
+                self._fetch_sitemap_urls(url, seen_sitemaps, fetch_slots)
+                for url in nested_sitemaps
+            )
+        ):
+            collector.urls.extend(urls)
+        return collector.urls
 
     async def crawl_multiple_urls(
         self, urls: List[str], max_concurrent: int = 10
-    ) -> List[Dict[str, Any]]:
-        crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Sub-sitemaps of an index routinely list the same pages; only crawl each once.
+        unique_urls: Dict[str, str] = {}
+        for url in urls:
+            unique_urls.setdefault(normalize_url(url), url)
+
         dispatcher = MemoryAdaptiveDispatcher(
-            memory_threshold_percent=70.0,
-            check_interval=1.0,
+            memory_threshold_percent=MEMORY_THRESHOLD_PERCENT,
+            check_interval=MEMORY_CHECK_INTERVAL,
             max_session_permit=max_concurrent,
         )
-        results = await self.arun_many(
-            urls=urls, config=crawl_config, dispatcher=dispatcher
-        )
-        return [
-            {"url": r.url, "markdown": r.markdown}
-            for r in results
-            if r.success and r.markdown
-        ]
+        # Results are yielded as they complete, so each CrawlResult (with its HTML,
+        # links and media) can be freed as soon as its markdown has been taken.
+        async for r in await self.arun_many(
+            urls=list(unique_urls.values()), config=STREAM_CONFIG, dispatcher=dispatcher
+        ):
+            if r.success and r.markdown:
+                yield {"url": r.url, "markdown": r.markdown}
 
     async def crawl_recursive_internal_links(
         self, start_urls: List[str], max_depth: int = 3, max_concurrent: int = 10
     ) -> List[Dict[str, Any]]:
-        run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-        dispatcher = MemoryAdaptiveDispatcher(
-            memory_threshold_percent=70.0,
-            check_interval=1.0,
-            max_session_permit=max_concurrent,
-        )
-
-        visited = set()
-
-        def normalize_url(url):
-            return urldefrag(url)[0]
-
-        current_urls = set([normalize_url(u) for u in start_urls])
+        visited = ScalableBloomFilter(initial_capacity=100_000, error_rate=1e-4)
+        queue: asyncio.Queue[Tuple[str, int]] = asyncio.Queue()
         results_all = []
 
-        for depth in range(max_depth):
-            urls_to_crawl = [
-                normalize_url(url)
-                for url in current_urls
-                if normalize_url(url) not in visited
-            ]
-            if not urls_to_crawl:
-                break
-
-            results = await self.arun_many(
-                urls=urls_to_crawl, config=run_config, dispatcher=dispatcher
-            )
-            next_level_urls = set()
-
-            for result in results:
-                norm_url = normalize_url(result.url)
-                visited.add(norm_url)
-
-                if result.success and result.markdown:
-                    results_all.append({"url": result.url, "markdown": result.markdown})
-                    for link in result.links.get("internal", []):
-                        next_url = normalize_url(link["href"])
-                        if next_url not in visited:
-                            next_level_urls.add(next_url)
-
-            current_urls = next_level_urls
+        for url in start_urls:
+            key = normalize_url(url)
+            if key not in visited:
+                visited.add(key)
+                queue.put_nowait((url, 0))
+
+        async def crawl_worker():
+            # Links are queued as soon as their page is crawled, so a slow page
+            # only holds up its own worker instead of the whole depth level.
+            while True:
+                url, depth = await queue.get()
+                try:
+                    # Same memory backoff MemoryAdaptiveDispatcher applies to arun_many.
+                    while psutil.virtual_memory().percent >= MEMORY_THRESHOLD_PERCENT:
+                        await asyncio.sleep(MEMORY_CHECK_INTERVAL)
+                    result = await self.arun(url=url, config=BYPASS_CONFIG)
+                    visited.add(normalize_url(result.url))
+
+                    if result.success and result.markdown:
+                        results_all.append(
+                            {"url": result.url, "markdown": result.markdown}
+                        )
+                        if depth + 1 >= max_depth:
+                            continue
+                        for link in result.links.get("internal", []):
+                            next_url = link["href"]
+                            key = normalize_url(next_url)
+                            if key in visited:
+                                continue
+                            visited.add(key)
+                            queue.put_nowait((next_url, depth + 1))
+                except Exception:
+                    logger.warning("Failed to crawl %s", url, exc_info=True)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(crawl_worker()) for _ in range(max_concurrent)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
         return results_all
@@ -1,7 +1,11 @@
+import asyncio
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import AsyncIterator
 
+import aiohttp
+import httpx
+
 from crawler import Crawler
 from fastmcp import FastMCP
 from crawl4ai import BrowserConfig
@@ -10,15 +14,56 @@ from crawl4ai import BrowserConfig
 @dataclass
 class MCPContext:
     crawler: Crawler
+    http_session: aiohttp.ClientSession
+    http2_client: httpx.AsyncClient
 
 
-@asynccontextmanager
-async def mcp_context_lifespan(server: FastMCP) -> AsyncIterator[MCPContext]:
+# The MCP server enters its lifespan once per client session over streamable HTTP,
+# so the browser and HTTP clients are shared process-wide: the first session opens
+# them and the last one to end closes them.
+_shared_context: MCPContext | None = None
+_shared_context_users = 0
+_shared_context_lock = asyncio.Lock()
+
+
+async def _open_context() -> MCPContext:
     browser_config = BrowserConfig(headless=True, verbose=False)
 
     crawler = Crawler(config=browser_config)
     await crawler.__aenter__()
+    # Low fan-out JSON APIs (Serper, MediaWiki) multiplex over one HTTP/2 connection;
+    # crawled sites keep going through the aiohttp session.
+    http2_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+    return MCPContext(
+        crawler=crawler,
+        http_session=crawler.http,
+        http2_client=http2_client,
+    )
+
+
+async def _close_context(context: MCPContext) -> None:
+    try:
+        await context.http2_client.aclose()
+    finally:
+        await context.crawler.__aexit__(None, None, None)
+
+
+@asynccontextmanager
+async def mcp_context_lifespan(server: FastMCP) -> AsyncIterator[MCPContext]:
+    global _shared_context, _shared_context_users
+
+    async with _shared_context_lock:
+        if _shared_context is None:
+            _shared_context = await _open_context()
+        _shared_context_users += 1
     try:
-        yield MCPContext(crawler=crawler)
+        yield _shared_context
     finally:
-        await crawler.__aexit__(None, None, None)
+        async with _shared_context_lock:
+            _shared_context_users -= 1
+            if _shared_context_users == 0:
+                context, _shared_context = _shared_context, None
+                await _close_context(context)
@@ -1,27 +1,50 @@
-import json
+import logging
 import os
-import traceback
+from typing import AsyncIterator
 
-import aiohttp
+import httpx
+from cachetools import TTLCache
 
-from crawler import Crawler
+from crawler import BYPASS_CONFIG, Crawler
 from fastmcp import FastMCP, Context
 from lifespan import mcp_context_lifespan
-from crawl4ai import CrawlerRunConfig, CacheMode, CrawlResult
-import wikipedia
-from utils import is_sitemap_url, is_text_url_file
+from crawl4ai import CrawlResult
+from utils import (
+    configure_logging,
+    detect_crawl_type,
+    fetch_content_type,
+    JsonResultsWriter,
+    to_json,
+)
 
+logger = logging.getLogger(__name__)
 
-mcp = FastMCP(
-    "mcp-internet-web-searcher",
-    lifespan=mcp_context_lifespan,
-    host=os.getenv("HOST", "0.0.0.0"),
-    port=os.getenv("PORT", 8051),
+WIKIPEDIA_API_URL = "https://{language}.wikipedia.org/w/api.php"
+WIKIPEDIA_USER_AGENT = (
+    "InternetWebSearcherMCP/0.1.0 (https://github.com/GuyAfik/InternetWebSearcherMCP)"
 )
+WIKIPEDIA_MAX_DISAMBIGUATION_OPTIONS = 10
+
+# Agents often repeat the same lookup within a session; keep answers for 10 minutes.
+_SEARCH_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=600)
+_WIKIPEDIA_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=600)
+
+# CrawlResult fields callers may add to a single-page response; the keys
+# crawl_single_page always sets can't be overridden.
+_EXTRA_RESPONSE_FIELDS = CrawlResult.model_fields.keys() - {
+    "success",
+    "url",
+    "markdown",
+    "title",
+}
+
+mcp = FastMCP("mcp-internet-web-searcher", lifespan=mcp_context_lifespan)
 
 
 @mcp.tool("crawl_single_url_page")
-async def crawl_single_page(ctx: Context, url: str) -> str:
+async def crawl_single_page(
+    ctx: Context, url: str, fields: list[str] | None = None
+) -> str:
     """
     Crawl a single web page and returns its content.
 
@@ -30,27 +53,71 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
     Args:
         ctx: The MCP server provided context
         url: URL of the web page to crawl
+        fields: Extra crawl result fields to include (e.g. 'links', 'media', 'metadata');
+            binary fields such as 'pdf' are base64-encoded
 
     Returns:
         str: a json representation including URL markdown data.
     """
+    unknown_fields = sorted(set(fields or []) - _EXTRA_RESPONSE_FIELDS)
+    if unknown_fields:
+        return to_json(
+            {
+                "success": False,
+                "url": url,
+                "error": f"Unknown fields: {', '.join(unknown_fields)}",
+            },
+            pretty=True,
+        )
+
     try:
-        run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-        crawler = ctx.request_context.lifespan_context.crawler
-        result: CrawlResult = await crawler.arun(url=url, config=run_config)
+        lifespan_context = ctx.request_context.lifespan_context
+        result: CrawlResult = await lifespan_context.crawler.arun(
+            url=url, config=BYPASS_CONFIG
+        )
         if result.success:
-            return json.dumps({"url": url, "markdown": result.markdown})
-        return json.dumps(
-            {"success": False, "url": url, "error": "No content found"}, indent=4
+            response = {
+                "success": True,
+                "url": url,
+                "markdown": result.markdown,
+                "title": (result.metadata or {}).get("title"),
+            }
+            for field in fields or []:
+                response[field] = getattr(result, field)
+            return to_json(response)
+        return to_json(
+            {"success": False, "url": url, "error": "No content found"}, pretty=True
         )
     except Exception as e:
-        traceback.print_exc()
-        return json.dumps({"success": False, "url": url, "error": str(e)}, indent=4)
+        logger.exception("Failed to crawl %s", url)
+        return to_json({"success": False, "url": url, "error": str(e)}, pretty=True)
+
+
+async def _crawl_docs(
+    crawler: Crawler, crawl_type: str, url: str, max_depth: int, max_concurrent: int
+) -> AsyncIterator[dict]:
+    if crawl_type == "sitemap":
+        async for doc in crawler.crawl_sitemap(url, max_concurrent=max_concurrent):
+            yield doc
+        return
+
+    if crawl_type == "text_file":
+        docs = await crawler.simple_crawl(url)
+    else:
+        docs = await crawler.crawl_recursive_internal_links(
+            [url], max_depth=max_depth, max_concurrent=max_concurrent
+        )
+    for doc in docs:
+        yield doc
 
 
 @mcp.tool("deep_crawl_url")
 async def indepth_crawl_url(
-    ctx: Context, url: str, max_depth: int = 3, max_concurrent: int = 10
+    ctx: Context,
+    url: str,
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    compress: bool = False,
 ) -> str:
     """
     Intelligently crawl a URL based on its type.
@@ -65,47 +132,47 @@ async def indepth_crawl_url(
         url: URL to crawl (can be a regular webpage, sitemap.xml, or .txt file)
         max_depth: Maximum recursion depth for regular URLs (default: 3)
         max_concurrent: Maximum number of concurrent browser sessions (default: 10)
+        compress: Return the successful result as base64-encoded zstd-compressed JSON
+            instead of plain JSON (default: False)
 
     Returns:
         str: a json representation including URL markdown data.
 
     """
     try:
-        crawler: Crawler = ctx.request_context.lifespan_context.crawler
-        if is_text_url_file(url):
-            crawl_results = await crawler.simple_crawl(url)
-            crawl_type = "text_file"
-        elif is_sitemap_url(url):
-            crawl_type = "sitemap"
-            crawl_results = await crawler.crawl_sitemap(
-                url, max_concurrent=max_concurrent
-            )
-        else:
-            crawl_type = "webpage"
-            crawl_results = await crawler.crawl_recursive_internal_links(
-                [url], max_depth=max_depth, max_concurrent=max_concurrent
-            )
-
-        if not crawl_results:
-            return json.dumps(
-                {"success": False, "url": url, "error": "No content found"}, indent=4
+        lifespan_context = ctx.request_context.lifespan_context
+        crawler: Crawler = lifespan_context.crawler
+        content_type = await fetch_content_type(lifespan_context.http_session, url)
+        crawl_type = detect_crawl_type(url, content_type)
+
+        # Pages are encoded into the response as they arrive, so sitemap crawls never
+        # hold every crawled doc at once.
+        results = JsonResultsWriter(
+            {"success": True, "crawl_type": crawl_type, "url": url}
+        )
+        urls_crawled = []
+        async for doc in _crawl_docs(
+            crawler, crawl_type, url, max_depth, max_concurrent
+        ):
+            results.add(doc)
+            if len(urls_crawled) < 5:
+                urls_crawled.append(doc["url"])
+
+        if not results.count:
+            return to_json(
+                {"success": False, "url": url, "error": "No content found"}, pretty=True
             )
 
-        return json.dumps(
-            {
-                "success": True,
-                "crawl_type": crawl_type,
-                "url": url,
-                "results": crawl_results,
-                "pages_crawled": len(crawl_results),
-                "urls_crawled": [doc["url"] for doc in crawl_results][:5]
-                + (["..."] if len(crawl_results) > 5 else []),
-            }
+        if results.count > 5:
+            urls_crawled.append("...")
+        return results.finish(
+            {"pages_crawled": results.count, "urls_crawled": urls_crawled},
+            compress=compress,
         )
 
     except Exception as e:
-        traceback.print_exc()
-        return json.dumps({"success": False, "url": url, "error": str(e)}, indent=4)
+        logger.exception("Failed to deep crawl %s", url)
+        return to_json({"success": False, "url": url, "error": str(e)}, pretty=True)
 
 
 @mcp.tool("adaptive_crawling")
@@ -125,7 +192,7 @@ async def adaptive_crawling(ctx: Context, url: str, query: str):
 
     try:
         result = await crawler.digest(start_url=url, query=query)
-        return json.dumps(
+        return to_json(
             {
                 "success": True,
                 "url": url,
@@ -138,9 +205,9 @@ async def adaptive_crawling(ctx: Context, url: str, query: str):
             }
         )
     except Exception as e:
-        traceback.print_exc()
-        return json.dumps(
-            {"success": False, "url": url, "query": query, "error": str(e)}, indent=4
+        logger.exception("Adaptive crawl of %s for %r failed", url, query)
+        return to_json(
+            {"success": False, "url": url, "query": query, "error": str(e)}, pretty=True
         )
 
 
@@ -157,18 +224,23 @@ async def web_search(ctx: Context, query: str, max_results: int = 5) -> str:
     Returns:
         JSON string with list of relevant URLs, titles, and snippets
     """
+    cache_key = (query, max_results)
+    if (cached := _SEARCH_CACHE.get(cache_key)) is not None:
+        return cached
+
     serper_api_key = os.getenv("SERPER_API_KEY")
     if not serper_api_key:
-        return json.dumps({"success": False, "error": "SERPER_API_KEY not set"})
+        return to_json({"success": False, "error": "SERPER_API_KEY not set"})
 
     url = "https://google.serper.dev/search"
     headers = {"X-API-KEY": serper_api_key, "Content-Type": "application/json"}
     payload = {"q": query, "num": max_results}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as resp:
-                data = await resp.json()
+        client = ctx.request_context.lifespan_context.http2_client
+        resp = await client.post(url, headers=headers, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
 
         # Extract top results
         results = []
@@ -181,10 +253,82 @@ async def web_search(ctx: Context, query: str, max_results: int = 5) -> str:
                 }
             )
 
-        return json.dumps({"query": query, "results": results}, indent=4)
+        response = to_json({"query": query, "results": results}, pretty=True)
+        _SEARCH_CACHE[cache_key] = response
+        return response
 
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)}, indent=4)
+        return to_json({"success": False, "error": str(e)}, pretty=True)
+
+
+async def _query_wikipedia(
+    client: httpx.AsyncClient, language: str, params: dict
+) -> dict:
+    resp = await client.get(
+        WIKIPEDIA_API_URL.format(language=language),
+        params={"action": "query", "format": "json", "formatversion": 2, **params},
+        headers={"User-Agent": WIKIPEDIA_USER_AGENT},
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _wikipedia_error(query: str, error: str) -> str:
+    return to_json({"query": query, "summary": None, "url": None, "error": error})
+
+
+async def _search_wikipedia(
+    client: httpx.AsyncClient, query: str, sentences: int, language: str
+) -> str:
+    # Search, summary and page URL all come back from a single request.
+    data = await _query_wikipedia(
+        client,
+        language,
+        {
+            "generator": "search",
+            "gsrsearch": query,
+            "gsrlimit": 1,
+            "prop": "extracts|info|pageprops",
+            "exintro": 1,
+            "explaintext": 1,
+            "exsentences": sentences,
+            "inprop": "url",
+            "ppprop": "disambiguation",
+            "redirects": 1,
+        },
+    )
+    pages = data.get("query", {}).get("pages", [])
+
+    if not pages:
+        return _wikipedia_error(query, "No results found.")
+
+    page = pages[0]
+    if "disambiguation" in page.get("pageprops", {}):
+        data = await _query_wikipedia(
+            client,
+            language,
+            {
+                "prop": "links",
+                "titles": page["title"],
+                "plnamespace": 0,
+                "pllimit": WIKIPEDIA_MAX_DISAMBIGUATION_OPTIONS,
+            },
+        )
+        options = [
+            link["title"]
+            for linked_page in data.get("query", {}).get("pages", [])
+            for link in linked_page.get("links", [])
+        ]
+        return _wikipedia_error(query, f"Disambiguation: {options}")
+
+    return to_json(
+        {
+            "query": query,
+            "title": page["title"],
+            "summary": page.get("extract"),
+            "url": page.get("fullurl"),
+        }
+    )
 
 
 @mcp.tool("wikipedia_search")
@@ -203,53 +347,34 @@ async def wikipedia_search(
     Returns:
         A JSON object with the article title, summary, and URL.
     """
-    try:
-        wikipedia.set_lang(language)  # Set default language
-        results = wikipedia.search(query)
-
-        if not results:
-            return json.dumps(
-                {
-                    "query": query,
-                    "summary": None,
-                    "url": None,
-                    "error": "No results found.",
-                }
-            )
-
-        page = wikipedia.page(results[0])
-        summary = wikipedia.summary(page.title, sentences=sentences)
-
-        return json.dumps(
-            {
-                "query": query,
-                "title": page.title,
-                "summary": summary,
-                "url": page.url,
-            }
-        )
+    cache_key = (query, sentences, language)
+    if (cached := _WIKIPEDIA_CACHE.get(cache_key)) is not None:
+        return cached
 
-    except wikipedia.exceptions.DisambiguationError as e:
-        return json.dumps(
-            {
-                "query": query,
-                "summary": None,
-                "url": None,
-                "error": f"Disambiguation: {e.options}",
-            }
-        )
-    except wikipedia.exceptions.PageError:
-        return json.dumps(
-            {"query": query, "summary": None, "url": None, "error": "Page not found."}
-        )
+    try:
+        client = ctx.request_context.lifespan_context.http2_client
+        response = await _search_wikipedia(client, query, sentences, language)
     except Exception as e:
-        return json.dumps(
-            {"query": query, "summary": None, "url": None, "error": str(e)}
-        )
+        return _wikipedia_error(query, str(e))
+
+    _WIKIPEDIA_CACHE[cache_key] = response
+    return response
 
 
 def main():
-    mcp.run(transport="stdio")
+    log_listener = configure_logging()
+    transport = os.getenv("TRANSPORT", "http")
+    try:
+        if transport == "stdio":
+            mcp.run(transport="stdio")
+        else:
+            mcp.run(
+                transport=transport,
+                host=os.getenv("HOST", "127.0.0.1"),
+                port=int(os.getenv("PORT", "8051")),
+            )
+    finally:
+        log_listener.stop()
 
 
 if __name__ == "__main__":
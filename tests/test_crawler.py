@@ -0,0 +1,53 @@
+import pytest
+from lxml import etree
+
+from crawler import _SitemapLocCollector
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://example.com/a</loc>
+    <image:image><image:loc>https://example.com/a.png</image:loc></image:image>
+  </url>
+  <url><loc> https://example.com/b </loc></url>
+</urlset>
+"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/sitemap-1.xml</loc></sitemap>
+  <sitemap><loc>https://example.com/sitemap-2.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+BARE_URLSET = b"""<urlset><url><loc>https://example.com/a</loc></url></urlset>"""
+
+
+def _collect(document: bytes, chunk_size: int) -> _SitemapLocCollector:
+    parser = etree.XMLParser(
+        target=_SitemapLocCollector(), resolve_entities=False, no_network=True
+    )
+    for start in range(0, len(document), chunk_size):
+        parser.feed(document[start : start + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+@pytest.mark.parametrize(
+    "document, urls, sitemap_urls",
+    [
+        (URLSET, ["https://example.com/a", "https://example.com/b"], []),
+        (
+            SITEMAP_INDEX,
+            [],
+            ["https://example.com/sitemap-1.xml", "https://example.com/sitemap-2.xml"],
+        ),
+        (BARE_URLSET, ["https://example.com/a"], []),
+    ],
+)
+def test_sitemap_loc_collector(document, urls, sitemap_urls, chunk_size):
+    collector = _collect(document, chunk_size)
+
+    assert collector.urls == urls
+    assert collector.sitemap_urls == sitemap_urls
@@ -0,0 +1,101 @@
+import base64
+
+import orjson
+import pytest
+import zstandard
+
+from utils import JsonResultsWriter, detect_crawl_type, normalize_url, to_json
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        # Scheme and host are case-insensitive.
+        ("HTTP://Example.COM/Path", "http://example.com/Path"),
+        # Default ports are dropped, others kept.
+        ("http://example.com:80/a", "http://example.com/a"),
+        ("https://example.com:443/a", "https://example.com/a"),
+        ("https://example.com:8443/a", "https://example.com:8443/a"),
+        ("http://example.com:443/a", "http://example.com:443/a"),
+        # IPv6 hosts keep their brackets.
+        ("http://[::1]:8080/a", "http://[::1]:8080/a"),
+        ("http://[2001:DB8::1]:80/a", "http://[2001:db8::1]/a"),
+        # Userinfo is preserved as written.
+        ("https://User:Pw@Example.com/a", "https://User:Pw@example.com/a"),
+        # Trailing slashes and fragments don't make a different page.
+        ("https://example.com/docs/", "https://example.com/docs"),
+        ("https://example.com/", "https://example.com"),
+        ("https://example.com/docs#intro", "https://example.com/docs"),
+        # Query parameters are sorted and empty ones dropped.
+        ("https://example.com/s?b=2&a=1", "https://example.com/s?a=1&b=2"),
+        ("https://example.com/s?b=2&&a=1&", "https://example.com/s?a=1&b=2"),
+        # Unparseable ports leave the URL untouched.
+        ("http://example.com:port/a/", "http://example.com:port/a/"),
+    ],
+)
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_normalize_url_equates_spellings():
+    assert normalize_url("HTTPS://example.com:443/a/?y=2&x=1#top") == normalize_url(
+        "https://EXAMPLE.com/a?x=1&y=2"
+    )
+
+
+@pytest.mark.parametrize(
+    "url, content_type, expected",
+    [
+        # Without a media type the URL decides.
+        ("https://example.com/llms.txt", None, "text_file"),
+        ("https://example.com/sitemap.xml", None, "sitemap"),
+        ("https://example.com/docs", None, "webpage"),
+        # XML media types upgrade any URL to a sitemap.
+        ("https://example.com/pages", "application/xml", "sitemap"),
+        ("https://example.com/pages", "text/xml", "sitemap"),
+        # HTML wins over a misleading suffix.
+        ("https://example.com/notes.txt", "text/html", "webpage"),
+        ("https://example.com/docs", "application/xhtml+xml", "webpage"),
+        # Plain text is a text file unless the URL is a sitemap or XML.
+        ("https://example.com/docs", "text/plain", "text_file"),
+        ("https://example.com/sitemap.xml", "text/plain", "sitemap"),
+        ("https://example.com/pages.xml", "text/plain", "sitemap"),
+        # Unknown media types fall back to the URL.
+        ("https://example.com/llms.txt", "application/octet-stream", "text_file"),
+        ("https://example.com/sitemap.xml", "application/json", "sitemap"),
+    ],
+)
+def test_detect_crawl_type(url, content_type, expected):
+    assert detect_crawl_type(url, content_type) == expected
+
+
+def test_to_json_encodes_bytes_as_base64():
+    assert orjson.loads(to_json({"pdf": b"%PDF-1.7"})) == {"pdf": "JVBERi0xLjc="}
+
+
+def test_to_json_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        to_json({"value": object()})
+
+
+@pytest.mark.parametrize("results", [[], [{"url": "https://example.com/a"}], [1, 2]])
+@pytest.mark.parametrize("head, tail", [({}, {}), ({"success": True}, {"count": 2})])
+def test_json_results_writer(head, tail, results):
+    writer = JsonResultsWriter(head)
+    for result in results:
+        writer.add(result)
+
+    assert writer.count == len(results)
+    assert orjson.loads(writer.finish(tail)) == {**head, "results": results, **tail}
+
+
+def test_json_results_writer_compressed():
+    writer = JsonResultsWriter({"success": True})
+    writer.add({"url": "https://example.com/a"})
+
+    frame = base64.b64decode(writer.finish({"count": 1}, compress=True))
+    assert orjson.loads(zstandard.decompress(frame)) == {
+        "success": True,
+        "results": [{"url": "https://example.com/a"}],
+        "count": 1,
+    }
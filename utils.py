@@ -1,4 +1,21 @@
-from urllib.parse import urlparse
+import asyncio
+import base64
+import logging
+import queue
+import sys
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+import aiohttp
+import orjson
+import zstandard
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_SITEMAP_CONTENT_TYPES = frozenset({"application/xml", "text/xml"})
+_HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+_ZSTD_COMPRESSOR = zstandard.ZstdCompressor(level=3)
 
 
 def is_sitemap_url(url: str) -> bool:
@@ -16,3 +33,193 @@ def is_sitemap_url(url: str) -> bool:
 
 def is_text_url_file(url: str) -> bool:
     return url.endswith(".txt")
+
+
+async def fetch_content_type(
+    session: aiohttp.ClientSession, url: str, timeout: float = 0.5
+) -> str | None:
+    """
+    Probe a URL with a HEAD request and return its media type.
+
+    Args:
+        session: HTTP session to issue the request with
+        url: URL to probe
+        timeout: Seconds to wait for the response before giving up
+
+    Returns:
+        The lowercased media type without parameters, or None if it could not be determined
+    """
+    try:
+        async with session.head(
+            url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            if not 200 <= resp.status < 300:
+                return None
+            content_type = resp.headers.get("Content-Type", "")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+    return content_type.partition(";")[0].strip().lower() or None
+
+
+def detect_crawl_type(url: str, content_type: str | None = None) -> str:
+    """
+    Decide how a URL should be crawled.
+
+    The served media type wins when it is known, so sitemaps at non-standard paths
+    are still crawled as sitemaps; otherwise the URL itself is inspected. A
+    ``text/plain`` sitemap or ``.xml`` URL stays a sitemap, since static hosts
+    often serve XML as plain text.
+
+    Args:
+        url: URL to crawl
+        content_type: Media type the URL is served with, if known
+
+    Returns:
+        One of "sitemap", "text_file" or "webpage"
+    """
+    if content_type in _SITEMAP_CONTENT_TYPES:
+        return "sitemap"
+    if content_type == "text/plain":
+        if is_sitemap_url(url) or urlparse(url).path.endswith(".xml"):
+            return "sitemap"
+        return "text_file"
+    if content_type in _HTML_CONTENT_TYPES:
+        return "webpage"
+    if is_text_url_file(url):
+        return "text_file"
+    if is_sitemap_url(url):
+        return "sitemap"
+    return "webpage"
+
+
+@lru_cache(maxsize=100_000)
+def normalize_url(url: str) -> str:
+    """
+    Canonicalize a URL so different spellings of the same page compare equal.
+
+    Applies the RFC 3986 case and scheme-based normalizations (sections 6.2.2 and
+    6.2.3): the fragment is dropped, scheme and host are lowercased, default ports
+    and trailing slashes are removed and query parameters are sorted.
+
+    Args:
+        url: URL to normalize
+
+    Returns:
+        The canonical form of the URL
+    """
+    url = url.partition("#")[0]
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = f"{userinfo}@{host}" if userinfo else host
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+
+    query = "&".join(sorted(param for param in parts.query.split("&") if param))
+    return urlunsplit((scheme, netloc, parts.path.rstrip("/"), query, ""))
+
+
+def _json_default(obj: Any) -> Any:
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def to_json(obj: Any, pretty: bool = False) -> str:
+    """
+    Serialize an object to a JSON string using orjson.
+
+    Args:
+        obj: Object to serialize
+        pretty: Whether to indent the output
+
+    Returns:
+        The JSON representation of the object
+    """
+    return orjson.dumps(
+        obj, default=_json_default, option=orjson.OPT_INDENT_2 if pretty else 0
+    ).decode()
+
+
+class JsonResultsWriter:
+    """
+    Serialize a JSON object around a ``results`` array that is encoded one item at a time.
+
+    Each result is written to the output buffer as soon as it is added, so callers can
+    drop it right away instead of holding every result until the whole response is
+    serialized.
+    """
+
+    def __init__(self, head: dict[str, Any]):
+        """
+        Args:
+            head: Fields to place before the ``results`` array
+        """
+        self._buffer = bytearray(orjson.dumps(head, default=_json_default)[:-1])
+        self._buffer += b',"results":[' if head else b'"results":['
+        self.count = 0
+
+    def add(self, result: Any) -> None:
+        if self.count:
+            self._buffer += b","
+        self._buffer += orjson.dumps(result, default=_json_default)
+        self.count += 1
+
+    def finish(self, tail: dict[str, Any], compress: bool = False) -> str:
+        """
+        Close the ``results`` array and the enclosing object.
+
+        Args:
+            tail: Fields to place after the ``results`` array
+            compress: Return the base64-encoded zstd frame of the document instead
+
+        Returns:
+            The JSON document, or its compressed form
+        """
+        self._buffer += b"]"
+        if tail:
+            self._buffer += b"," + orjson.dumps(tail, default=_json_default)[1:]
+        else:
+            self._buffer += b"}"
+        payload, self._buffer = self._buffer, bytearray()
+        if compress:
+            return base64.b64encode(_ZSTD_COMPRESSOR.compress(payload)).decode()
+        return payload.decode()
+
+
+def configure_logging(level: int = logging.WARNING) -> QueueListener:
+    """
+    Send log records to stderr through a queue.
+
+    Records are only enqueued on the calling thread and written by a background
+    listener, so logging never blocks a request, and stdout stays free for the
+    stdio transport's JSON-RPC messages.
+
+    Args:
+        level: Minimum level for the root logger
+
+    Returns:
+        The started listener; stop it on shutdown to flush pending records
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    listener = QueueListener(log_queue, stderr_handler)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(QueueHandler(log_queue))
+    listener.start()
+    return listener